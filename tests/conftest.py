@@ -0,0 +1,104 @@
+import pathlib
+import re
+import subprocess
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import pytest
+
+class Result(NamedTuple):
+    returncode: int
+    stdout: str
+    stderr: str
+
+def run(argv, cwd="/app", want_stderr=True):
+    """Run a command given as an argv list and return the result.
+
+    Running without a shell skips the intermediate /bin/sh fork and its
+    command-line tokenization. The 1 MiB pipe buffer lets large cargo
+    outputs drain in big chunks instead of many small reads. Callers
+    that never inspect stderr can pass want_stderr=False to skip
+    decoding it.
+    """
+    process = subprocess.Popen(
+        argv,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=1024 * 1024,
+    )
+    stdout, stderr = process.communicate()
+    out = stdout.decode("utf-8", "replace")
+    err = stderr.decode("utf-8", "replace") if want_stderr else ""
+    return Result(process.returncode, out, err)
+
+@pytest.fixture(scope="session")
+def cargo_results():
+    """Run the cargo commands concurrently, once for the whole session.
+
+    The commands are independent of each other, so they can overlap on
+    multi-core runners; the build is submitted first so the other
+    commands hit a warm target directory as soon as possible.
+    """
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = {
+            "build": executor.submit(run, ["cargo", "build", "--release"]),
+            "check": executor.submit(run, ["cargo", "check"]),
+            "tree": executor.submit(run, ["cargo", "tree"], want_stderr=False),
+            "tree_p": executor.submit(run, ["cargo", "tree", "--format", "{p}"]),
+            "tree_dup": executor.submit(run, ["cargo", "tree", "--duplicates"], want_stderr=False),
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+@pytest.fixture(scope="session")
+def cargo_build(cargo_results):
+    """Result of `cargo build --release`."""
+    return cargo_results["build"]
+
+@pytest.fixture(scope="session")
+def cargo_check(cargo_results):
+    """Result of `cargo check`."""
+    return cargo_results["check"]
+
+@pytest.fixture(scope="session")
+def cargo_tree(cargo_results):
+    """Result of `cargo tree`."""
+    return cargo_results["tree"]
+
+@pytest.fixture(scope="session")
+def cargo_tree_p(cargo_results):
+    """Output of `cargo tree --format '{p}'` as a string."""
+    result = cargo_results["tree_p"]
+    assert result.returncode == 0, f"cargo tree failed: {result.stderr}"
+    return result.stdout
+
+_TREE_PKG_RE = re.compile(r'([a-zA-Z0-9_-]+) v(\d+)\.(\d+)(?:\.(\d+))?')
+
+@pytest.fixture(scope="session")
+def tree_versions(cargo_tree_p):
+    """(name, major, minor) tuples parsed once from the formatted tree."""
+    return [
+        (match.group(1), int(match.group(2)), int(match.group(3)))
+        for match in _TREE_PKG_RE.finditer(cargo_tree_p)
+    ]
+
+@pytest.fixture(scope="session")
+def cargo_tree_duplicates(cargo_results):
+    """Result of `cargo tree --duplicates`."""
+    return cargo_results["tree_dup"]
+
+@pytest.fixture(scope="session")
+def cargo_lock_text():
+    """Read Cargo.lock once for the whole session."""
+    return pathlib.Path("/app/Cargo.lock").read_text()
+
+@pytest.fixture(scope="session")
+def cargo_toml_text():
+    """Read Cargo.toml once for the whole session."""
+    return pathlib.Path("/app/Cargo.toml").read_text()
+
+@pytest.fixture(scope="session")
+def cargo_toml(cargo_toml_text):
+    """Cargo.toml parsed into a dict once for the whole session."""
+    return tomllib.loads(cargo_toml_text)